@@ -67,6 +67,7 @@ setup(
     entry_points={
         'console_scripts': [
             'ticketml_print = ticketml.example_print:main',
+            'ticketml_loadtest = ticketml.loadtest:main',
         ],
     },
 )
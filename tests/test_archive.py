@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 the TicketML authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE.md file.
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import ticketml
+from ticketml.ticketml import Alignment, Emphasis
+import io
+import unittest
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+from nose.tools import *
+
+
+class TextBackendTests(unittest.TestCase):
+    def setUp(self):
+        self.output = io.StringIO()
+        self.backend = ticketml.TextBackend(self.output, chars_per_line=10)
+
+    def render(self, xml):
+        ticketml.TicketML.parse(xml).go({}, self.backend)
+        return self.output.getvalue().split('\n')[:-2]
+
+    def test_buffers_until_cut(self):
+        self.backend.print_text('hello')
+        self.backend.linebreak()
+        self.assertEqual(self.output.getvalue(), '')
+        self.backend.feed_and_cut()
+        self.assertEqual(self.output.getvalue(), 'hello\n' + '-' * 10 + '\n')
+
+    def test_alignment(self):
+        lines = self.render('<ticket><align mode="center">abcd</align><br /><align mode="right">ab</align></ticket>')
+        self.assertEqual(lines, ['   abcd', '        ab'])
+
+    def test_alignment_change_midline_applies_to_next_line(self):
+        self.backend.print_text('ab')
+        self.backend.set_alignment(Alignment.right)
+        self.backend.print_text('\ncd')
+        self.backend.feed_and_cut()
+        self.assertEqual(self.output.getvalue().split('\n')[:2], ['ab', '        cd'])
+
+    def test_alignment_after_logo_applies_to_next_line(self):
+        lines = self.render('<ticket><logo num="1" /><align mode="center">abc</align><br />d</ticket>')
+        self.assertEqual(lines, ['', '[logo 1]', 'abc', 'd'])
+
+    def test_alignment_after_style_change_applies_to_next_line(self):
+        lines = self.render('<ticket><br /><b><align mode="right">ab</align></b><br />cd</ticket>')
+        self.assertEqual(lines, ['', 'ab', 'cd'])
+
+    def test_font_width_takes_columns(self):
+        lines = self.render('<ticket><font width="2">abc</font>d</ticket>')
+        self.assertEqual(lines, ['a b c d'])
+
+    def test_wraps_like_printer(self):
+        lines = self.render('<ticket><font width="3">abcd</font></ticket>')
+        self.assertEqual(lines, ['a  b  c', 'd'])
+
+    def test_logo_and_barcode(self):
+        lines = self.render('<ticket>a<logo num="2" /><barcode type="CODE39">AB</barcode></ticket>')
+        # the printer sends a newline before each, so a blank line follows the logo
+        self.assertEqual(lines, ['a', '[logo 2]', '', '[barcode code_39: AB]'])
+
+    def test_print_encoded_text(self):
+        self.backend.print_encoded_text(b'\x9c5')
+        self.backend.feed_and_cut()
+        self.assertEqual(self.output.getvalue().split('\n')[0], '£5')
+
+
+class FanoutBackendTests(unittest.TestCase):
+    def test_forwards_to_every_backend(self):
+        primary, sink = mock.MagicMock(), mock.MagicMock()
+        backend = ticketml.FanoutBackend(primary, sink)
+        backend.set_emphasis(Emphasis.on)
+        primary.set_emphasis.assert_called_once_with(Emphasis.on)
+        sink.set_emphasis.assert_called_once_with(Emphasis.on)
+
+    def test_primary_answers_queries(self):
+        primary, sink = mock.MagicMock(), mock.MagicMock()
+        primary.get_characters_per_line.return_value = 44
+        backend = ticketml.FanoutBackend(primary, sink)
+        self.assertEqual(backend.get_characters_per_line(1), 44)
+        self.assertFalse(sink.get_characters_per_line.called)
+
+    @raises(AttributeError)
+    def test_rejects_sinks_without_method(self):
+        ticketml.FanoutBackend(mock.MagicMock(), object()).print_encoded_text(b'hi')
+
+    @raises(AttributeError)
+    def test_unknown_method(self):
+        ticketml.FanoutBackend(object()).print_text('hi')
+
+    def test_single_pass_to_printer_and_archives(self):
+        serial = mock.MagicMock()
+        raw = io.BytesIO()
+        text = io.StringIO()
+        printer = ticketml.CbmBackend(ticketml.ArchivingSerial(serial, raw))
+        backend = ticketml.FanoutBackend(printer, ticketml.TextBackend(text))
+        ticketml.TicketML.parse('<ticket><b>Hello</b></ticket>').go({}, backend)
+        printer._serial.flush()
+        self.assertEqual(raw.getvalue(), b''.join(call[0][0] for call in serial.write.call_args_list))
+        self.assertEqual(text.getvalue().split('\n')[0], 'Hello')
+
+    def test_text_layout_matches_printer_after_logo(self):
+        serial = mock.MagicMock()
+        text = io.StringIO()
+        printer = ticketml.CbmBackend(serial)
+        backend = ticketml.FanoutBackend(printer, ticketml.TextBackend(text))
+        ticketml.TicketML.parse('<ticket><logo num="1" /><align mode="center">abc</align></ticket>').go({}, backend)
+        sent = b''.join(call[0][0] for call in serial.write.call_args_list)
+        # the printer only sees the centre command after abc has been sent...
+        self.assertTrue(sent.index(b'abc') < sent.index(b'\x1ba\x01'))
+        # ...so abc is printed left-aligned, and archived that way
+        self.assertEqual(text.getvalue().split('\n')[:3], ['', '[logo 1]', 'abc'])
+
+    def render_both(self, xml, printer_cls=ticketml.CbmBackend):
+        serial = mock.MagicMock()
+        text = io.StringIO()
+        printer = printer_cls(serial)
+        backend = ticketml.FanoutBackend(printer, ticketml.TextBackend.for_printer(text, printer))
+        ticketml.TicketML.parse(xml).go({}, backend)
+        sent = b''.join(call[0][0] for call in serial.write.call_args_list)
+        return sent, text.getvalue().split('\n')[:-2]
+
+    def test_blank_line_before_logo_after_linebreak(self):
+        sent, lines = self.render_both('<ticket>a<br /><logo num="1" /></ticket>')
+        self.assertIn(b'a\n\n\x1cp\x01', sent)
+        self.assertEqual(lines, ['a', '', '[logo 1]'])
+
+    def test_blank_line_before_barcode_after_linebreak(self):
+        sent, lines = self.render_both('<ticket>a<br /><barcode type="CODE39">AB</barcode></ticket>')
+        self.assertIn(b'a\n\x1dH\x02\x1dh\x0c\n\x1dk', sent)
+        self.assertEqual(lines, ['a', '', '[barcode code_39: AB]'])
+
+    def test_pending_alignment_applies_to_logo(self):
+        sent, lines = self.render_both('<ticket>x<align mode="center"><logo num="1" /></align></ticket>')
+        # the centre command is held back until the newline before the logo
+        self.assertIn(b'x\n\x1ba\x01\x1cp\x01', sent)
+        self.assertEqual(lines[1], '[logo 1]'.center(48).rstrip())
+
+    def test_first_ticket_matches_printer_start_state(self):
+        # CbmBackend sets its printing mode on creation, so it isn't at a
+        # line break and the first alignment is deferred
+        sent, lines = self.render_both('<ticket><align mode="right">a</align><br />b</ticket>')
+        self.assertTrue(sent.index(b'a\n') < sent.index(b'\x1ba\x02'))
+        self.assertEqual(lines, ['a', 'b'])
+
+        sent, lines = self.render_both('<ticket><align mode="right">a</align><br />b</ticket>', ticketml.Ibm4610Backend)
+        self.assertTrue(sent.index(b'\x1ba\x02') < sent.index(b'a\n'))
+        self.assertEqual(lines, ['a'.rjust(44), 'b'])
+
+    def test_for_printer_uses_printer_settings(self):
+        printer = ticketml.Ibm4610Backend(mock.MagicMock())
+        text = ticketml.TextBackend.for_printer(io.StringIO(), printer)
+        self.assertEqual(text.get_characters_per_line(1), 44)
+        self.assertEqual(text._codepage, printer._commands.codepage)
+
+
+class ArchivingSerialTests(unittest.TestCase):
+    def test_tees_and_buffers(self):
+        serial = mock.MagicMock()
+        archive = io.BytesIO()
+        archiving = ticketml.ArchivingSerial(serial, archive, buffer_size=4)
+        archiving.write(b'ab')
+        serial.write.assert_called_once_with(b'ab')
+        self.assertEqual(archive.getvalue(), b'')
+        archiving.write(b'cd')
+        self.assertEqual(archive.getvalue(), b'abcd')
+        archiving.write(b'e')
+        archiving.flush()
+        self.assertEqual(archive.getvalue(), b'abcde')
+        self.assertTrue(serial.flush.called)
@@ -8,7 +8,7 @@
 from __future__ import division, absolute_import, print_function, unicode_literals
 
 import ticketml
-from ticketml.ticketml import Emphasis, Alignment
+from ticketml.ticketml import Emphasis, Alignment, BarcodeType, BarcodeHriPosition, CommandTable
 import unittest
 try:
     import unittest.mock as mock
@@ -49,6 +49,29 @@ class BackendMixin(object):
         self.mock_serial.reset_mock()
         self.backend.print_text('ルーク')
 
+    def test_set_font_size(self):
+        self.mock_serial.reset_mock()
+        self.backend.set_font_size(2, 3)
+        self.mock_serial.write.assert_called_once_with(b'\x1d!\x12')
+
+    @raises(AssertionError)
+    def test_set_font_size_rejects_out_of_range(self):
+        self.backend.set_font_size(9, 1)
+
+    @raises(AssertionError)
+    def test_print_logo_rejects_out_of_range(self):
+        self.backend.print_logo(-1)
+
+    def test_print_logo_rejects_out_of_range_without_sending(self):
+        self.mock_serial.reset_mock()
+        self.assertRaises(AssertionError, self.backend.print_logo, 256)
+        self.assertFalse(self.mock_serial.write.called)
+
+    def test_command_table_is_shared_between_instances(self):
+        other = type(self.backend)(mock.MagicMock())
+        self.assertIs(self.backend._commands, other._commands)
+        self.assertIs(self.backend._commands, CommandTable.for_backend(type(self.backend)))
+
 
 class CbmBackendTests(BackendMixin, unittest.TestCase):
     def __init__(self, *args, **kwargs):
@@ -63,8 +86,25 @@ class CbmBackendTests(BackendMixin, unittest.TestCase):
         self.backend.set_emphasis(Emphasis.on)
         self.mock_serial.write.assert_any_call(b'\x1b!\x08')  # sets printing mode to 0
 
+    def test_print_barcode(self):
+        self.mock_serial.reset_mock()
+        self.backend.print_barcode(BarcodeType.code_39, 'AB', BarcodeHriPosition.below, 12)
+        self.mock_serial.write.assert_any_call(b'\x1dH\x02\x1dh\x0c')
+        self.mock_serial.write.assert_called_with(b'\x1dkE\x02AB')
+
 
 class Ibm4610BackendTests(BackendMixin, unittest.TestCase):
     def __init__(self, *args, **kwargs):
         super(Ibm4610BackendTests, self).__init__(*args, **kwargs)
         self.backend = ticketml.Ibm4610Backend(self.mock_serial)
+
+    def test_set_emphasis(self):
+        self.mock_serial.reset_mock()
+        self.backend.set_emphasis(Emphasis.on)
+        self.mock_serial.write.assert_called_once_with(b'\x1bG\x01')
+
+    def test_print_barcode(self):
+        self.mock_serial.reset_mock()
+        self.backend.print_barcode(BarcodeType.code_39, 'AB', BarcodeHriPosition.below, 12)
+        self.mock_serial.write.assert_any_call(b'\x1dH\x02\x1dh\x0c')
+        self.mock_serial.write.assert_called_with(b'\x1dk\x04AB\x00')
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 the TicketML authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE.md file.
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import ticketml
+from ticketml.loadtest import PROFILES, PrinterProfile, VirtualPrinter, LoadTest
+from ticketml.ticketml import BarcodeType, BarcodeHriPosition
+import unittest
+from nose.tools import *
+
+
+def profile(backend_cls=ticketml.CbmBackend, **kwargs):
+    settings = dict(
+        baudrate=10000, buffer_size=100,
+        line_time=0.1, cut_time=1.0, logo_time=0.5, barcode_time=0.25)
+    settings.update(kwargs)
+    return PrinterProfile('test', backend_cls, **settings)
+
+
+class VirtualPrinterTests(unittest.TestCase):
+    def test_write_takes_transmission_time(self):
+        printer = VirtualPrinter(profile())
+        printer.write(b'x' * 50)
+        self.assertAlmostEqual(printer.now, 0.05)
+        self.assertAlmostEqual(printer.finished_at, 0.05)
+
+    def test_lines_cuts_and_logos_take_mechanism_time(self):
+        printer = VirtualPrinter(profile())
+        printer.write(b'a\n')
+        self.assertAlmostEqual(printer.busy_time, 0.1)
+        printer.write(b'\x1cp\x01\x00')
+        self.assertAlmostEqual(printer.busy_time, 0.6)
+        printer.write(b'\n\n\n\n\x1dV\x01')
+        self.assertAlmostEqual(printer.busy_time, 2.0)
+
+    def test_font_height_scales_line_time(self):
+        printer = VirtualPrinter(profile())
+        printer.write(b'\x1d!\x01')
+        printer.write(b'\n')
+        self.assertAlmostEqual(printer.busy_time, 0.2)
+
+    def test_full_buffer_blocks_writes(self):
+        printer = VirtualPrinter(profile(buffer_size=10))
+        printer.write(b'\n' * 10)
+        self.assertAlmostEqual(printer.finished_at, 1.01)
+        printer.write(b'x')
+        self.assertAlmostEqual(printer.now, 1.011)
+
+    def test_ibm_barcode_is_not_a_cut(self):
+        # the IBM cut is 0c, which is also the height byte of a 12 dot barcode
+        printer = VirtualPrinter(profile(ticketml.Ibm4610Backend))
+        backend = ticketml.Ibm4610Backend(printer)
+        backend.print_barcode(BarcodeType.code_39, 'AB', BarcodeHriPosition.below, 12)
+        self.assertAlmostEqual(printer.busy_time, 0.35)
+        backend.feed_and_cut()
+        self.assertAlmostEqual(printer.busy_time, 1.35)
+
+    def test_cut_after_pending_alignment(self):
+        printer = VirtualPrinter(profile())
+        ticketml.TicketML.parse('<ticket><align mode="center">x</align></ticket>').go({}, ticketml.CbmBackend(printer))
+        self.assertAlmostEqual(printer.busy_time, 1.4)
+
+    def test_command_arguments_are_not_line_feeds(self):
+        printer = VirtualPrinter(profile())
+        backend = ticketml.CbmBackend(printer)
+        backend.print_barcode(BarcodeType.code_39, 'A' * 10, BarcodeHriPosition.below, 10)
+        self.assertAlmostEqual(printer.busy_time, 0.35)
+        backend.print_logo(10)
+        self.assertAlmostEqual(printer.busy_time, 0.95)
+
+    def test_backend_drives_printer(self):
+        printer = VirtualPrinter(profile())
+        ticketml.TicketML.parse('<ticket>hello</ticket>').go({}, ticketml.CbmBackend(printer))
+        self.assertTrue(printer.busy_time >= 1.0)
+
+
+class LoadTestTests(unittest.TestCase):
+    def test_more_printers_increase_throughput(self):
+        one = LoadTest(PROFILES['cbm'], printers=1).run(20)
+        three = LoadTest(PROFILES['cbm'], printers=3).run(20)
+        self.assertEqual(one.tickets, 20)
+        self.assertTrue(three.tickets_per_minute > 2 * one.tickets_per_minute)
+        self.assertTrue(three.latency_percentile(90) < one.latency_percentile(90))
+
+    def test_arrival_rate_leaves_printers_idle(self):
+        result = LoadTest(PROFILES['ibm4610'], printers=2, arrival_rate=10).run(10)
+        self.assertAlmostEqual(result.tickets_per_minute, 10, delta=1)
+        for idle in result.idle_times():
+            self.assertTrue(idle > result.duration / 2)
+
+    def test_same_seed_gives_same_results(self):
+        first = LoadTest(PROFILES['cbm'], printers=2, seed=3).run(30)
+        second = LoadTest(PROFILES['cbm'], printers=2, seed=3).run(30)
+        self.assertEqual(first.latencies, second.latencies)
+        self.assertEqual(first.duration, second.duration)
+
+    def test_render_cost_is_simulated(self):
+        free = LoadTest(profile(), arrival_rate=6).run(3)
+        costly = LoadTest(profile(), arrival_rate=6, render_cost=0.5).run(3)
+        for free_latency, costly_latency in zip(free.latencies, costly.latencies):
+            self.assertAlmostEqual(costly_latency, free_latency + 0.5)
+
+    def test_report(self):
+        report = LoadTest(PROFILES['cbm'], printers=2).run(5).report()
+        self.assertIn('tickets/minute', report)
+        self.assertIn('printer 1:', report)
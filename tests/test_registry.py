@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 the TicketML authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE.md file.
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import ticketml
+from ticketml.registry import PreparedTemplate, TemplateRegistry, prepare
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+from nose.tools import *
+
+
+TICKET = '<?xml version="1.0" ?><ticket><logo num="1" /><b>Hello</b> £5<br /><font width="2"><sensibreak>a very long film title which will not fit on one line</sensibreak></font></ticket>'
+
+
+def render(template, backend_cls):
+    serial = mock.MagicMock()
+    template.go({}, backend_cls(serial))
+    return b''.join(call[0][0] for call in serial.write.call_args_list)
+
+
+class TemplateRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_prepared_template_matches_direct_render(self):
+        for backend_cls in (ticketml.CbmBackend, ticketml.Ibm4610Backend):
+            self.assertEqual(
+                render(prepare(TICKET, backend_cls), backend_cls),
+                render(ticketml.TicketML.parse(TICKET), backend_cls))
+
+    def test_fresh_registry_loads_from_disk(self):
+        TemplateRegistry(self.cache_dir).get(TICKET, ticketml.CbmBackend)
+        with mock.patch.object(ticketml.TicketML, 'parse') as parse:
+            template = TemplateRegistry(self.cache_dir).get(TICKET, ticketml.CbmBackend)
+        self.assertFalse(parse.called)
+        self.assertEqual(
+            render(template, ticketml.CbmBackend),
+            render(ticketml.TicketML.parse(TICKET), ticketml.CbmBackend))
+
+    def test_changed_template_gets_new_entry(self):
+        registry = TemplateRegistry(self.cache_dir)
+        registry.get(TICKET, ticketml.CbmBackend)
+        registry.get(TICKET.replace('Hello', 'Goodbye'), ticketml.CbmBackend)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_backends_get_separate_entries(self):
+        registry = TemplateRegistry(self.cache_dir)
+        self.assertNotEqual(
+            registry.cache_key(TICKET, ticketml.CbmBackend),
+            registry.cache_key(TICKET, ticketml.Ibm4610Backend))
+
+    def test_corrupt_entry_is_prepared_again(self):
+        registry = TemplateRegistry(self.cache_dir)
+        key = registry.cache_key(TICKET, ticketml.CbmBackend)
+        with open(os.path.join(self.cache_dir, '{}.json'.format(key)), 'wb') as f:
+            f.write(b'[["print_encoded')
+        template = registry.get(TICKET, ticketml.CbmBackend)
+        self.assertEqual(
+            render(template, ticketml.CbmBackend),
+            render(ticketml.TicketML.parse(TICKET), ticketml.CbmBackend))
+        self.assertIsNotNone(TemplateRegistry(self.cache_dir)._load(key, ticketml.CbmBackend))
+
+    def test_json_round_trip(self):
+        template = prepare(TICKET, ticketml.CbmBackend)
+        loaded = PreparedTemplate.from_json(template.to_json())
+        self.assertEqual(loaded.operations, template.operations)
+
+    def test_tampered_entry_is_not_replayed(self):
+        registry = TemplateRegistry(self.cache_dir)
+        key = registry.cache_key(TICKET, ticketml.CbmBackend)
+        with open(os.path.join(self.cache_dir, '{}.json'.format(key)), 'wb') as f:
+            f.write(b'[["_write_immediately", [{"bytes": "1b40"}]]]')
+        template = registry.get(TICKET, ticketml.CbmBackend)
+        self.assertNotIn('_write_immediately', [name for name, args in template.operations])
+
+    @raises(ValueError)
+    def test_rejects_unexpected_arguments(self):
+        PreparedTemplate.from_json('[["print_logo", [[1]]]]')
+
+    @raises(ValueError)
+    def test_rejects_enum_attributes(self):
+        PreparedTemplate.from_json('[["set_emphasis", [{"enum": "Emphasis", "name": "__class__"}]]]')
+
+    @raises(ValueError)
+    def test_rejects_wrong_argument_types(self):
+        PreparedTemplate.from_json('[["print_logo", ["x"]]]')
+
+    @raises(ValueError)
+    def test_rejects_wrong_argument_count(self):
+        PreparedTemplate.from_json('[["linebreak", []], ["set_font_size", [1]]]')
+
+    @raises(ValueError)
+    def test_rejects_out_of_range_arguments(self):
+        PreparedTemplate.from_json('[["set_font_size", [1, 9]]]')
+
+    @raises(ValueError)
+    def test_rejects_mismatched_enum(self):
+        PreparedTemplate.from_json('[["set_emphasis", [{"enum": "Underline", "name": "on"}]]]')
+
+    @raises(UnicodeEncodeError)
+    def test_rejects_unencodable_barcode_for_backend(self):
+        PreparedTemplate.from_json(
+            '[["print_barcode", [{"enum": "BarcodeType", "name": "code_39"}, "\\u30eb",'
+            ' {"enum": "BarcodeHriPosition", "name": "below"}, 12]]]', ticketml.CbmBackend)
+
+    def test_partly_invalid_entry_is_prepared_again(self):
+        registry = TemplateRegistry(self.cache_dir)
+        key = registry.cache_key(TICKET, ticketml.CbmBackend)
+        with open(os.path.join(self.cache_dir, '{}.json'.format(key)), 'wb') as f:
+            f.write(b'[["print_logo", [1]], ["set_font_size", [1]]]')
+        template = registry.get(TICKET, ticketml.CbmBackend)
+        self.assertEqual(
+            render(template, ticketml.CbmBackend),
+            render(ticketml.TicketML.parse(TICKET), ticketml.CbmBackend))
+
+    def test_entries_are_readable_by_other_users(self):
+        TemplateRegistry(self.cache_dir).get(TICKET, ticketml.CbmBackend)
+        umask = os.umask(0)
+        os.umask(umask)
+        for filename in os.listdir(self.cache_dir):
+            mode = os.stat(os.path.join(self.cache_dir, filename)).st_mode & 0o777
+            self.assertEqual(mode, 0o666 & ~umask)
+
+    def test_memory_is_bounded(self):
+        registry = TemplateRegistry(self.cache_dir, memory_size=2)
+        first = registry.get(TICKET, ticketml.CbmBackend)
+        registry.get(TICKET.replace('Hello', 'A'), ticketml.CbmBackend)
+        self.assertIs(registry.get(TICKET, ticketml.CbmBackend), first)
+        registry.get(TICKET.replace('Hello', 'B'), ticketml.CbmBackend)
+        self.assertEqual(len(registry._memory), 2)
+        self.assertIs(registry.get(TICKET, ticketml.CbmBackend), first)
+
+    def test_clear(self):
+        registry = TemplateRegistry(self.cache_dir)
+        registry.get(TICKET, ticketml.CbmBackend)
+        registry.clear()
+        self.assertEqual(os.listdir(self.cache_dir), [])
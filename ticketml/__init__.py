@@ -5,3 +5,5 @@ __email__ = 'git@lukegb.com'
 __version__ = '0.1'
 
 from .ticketml import Ibm4610Backend, CbmBackend, TicketML
+from .registry import PreparedTemplate, TemplateRegistry
+from .archive import ArchivingSerial, FanoutBackend, TextBackend
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 the TicketML authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE.md file.
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+from .ticketml import Alignment, DoubleWidth
+
+class FanoutBackend(object):
+    """Drives several backends from a single template traversal.
+
+    Every backend call is forwarded to the primary backend and then to each
+    sink, so every sink must implement the full backend interface. Questions
+    about the printer (such as how many characters fit on a line) are
+    answered by the primary backend alone, so every sink sees exactly the
+    same layout decisions.
+    """
+
+    def __init__(self, primary, *sinks):
+        self.primary = primary
+        self.sinks = sinks
+
+    def get_characters_per_line(self, font_width):
+        return self.primary.get_characters_per_line(font_width)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        # a sink missing a method is an error, not something to skip: an
+        # archive which silently drops calls is worse than none
+        targets = tuple(getattr(target, name) for target in (self.primary,) + self.sinks)
+
+        def fanout(*args):
+            for target in targets:
+                target(*args)
+        # cache on the instance so later calls skip __getattr__ entirely
+        setattr(self, name, fanout)
+        return fanout
+
+class TextBackend(object):
+    """Renders tickets as plain text for a human-readable archive.
+
+    Text is laid out in printer columns: characters printed at width N take
+    up N columns, lines wrap where the printer would wrap them, and
+    alignment is applied by padding. As on the printer, an alignment change
+    only takes effect immediately at a line break; otherwise it applies from
+    the next line. Styles which don't change the layout (emphasis,
+    underline, double height) are ignored. Each ticket is buffered and
+    written to output when it is cut.
+
+    Use for_printer to build one which matches a printer backend.
+    """
+
+    def __init__(self, output, chars_per_line=48, codepage='cp437'):
+        self._output = output
+        self._chars_per_line = chars_per_line
+        self._codepage = codepage
+
+        self._lines = []
+        self._line = []
+        self._column = 0
+        self._at_linebreak = True
+
+        self._font_width = 1
+        self._double_width = False
+        self._alignment = Alignment.left
+        self._line_alignment = Alignment.left
+
+    @classmethod
+    def for_printer(cls, output, printer):
+        """Build a TextBackend laid out like printer, starting in its current state."""
+        backend = cls(output, printer.get_characters_per_line(1), printer._commands.codepage)
+        backend._at_linebreak = printer._at_linebreak
+        return backend
+
+    def get_characters_per_line(self, font_width):
+        return self._chars_per_line // font_width
+
+    def _width(self):
+        if self._double_width:
+            return self._font_width * 2
+        return self._font_width
+
+    def _newline(self):
+        text = ''.join(self._line)
+        padding = self._chars_per_line - self._column
+        if padding > 0:
+            if self._line_alignment == Alignment.center:
+                text = ' ' * (padding // 2) + text
+            elif self._line_alignment == Alignment.right:
+                text = ' ' * padding + text
+        self._lines.append(text.rstrip())
+        self._line = []
+        self._column = 0
+        self._line_alignment = self._alignment
+        self._at_linebreak = True
+
+    def _add(self, text):
+        width = self._width()
+        while text:
+            room = (self._chars_per_line - self._column) // width
+            if room <= 0:
+                if not self._line:
+                    # wider than the whole line: print it anyway
+                    room = 1
+                else:
+                    self._newline()
+                    continue
+            chunk, text = text[:room], text[room:]
+            if width > 1:
+                chunk = ''.join(c + ' ' * (width - 1) for c in chunk)
+            self._line.append(chunk)
+            self._column += len(chunk)
+
+    def _add_marker(self, marker):
+        # the printer always sends a newline before a logo or barcode, which
+        # ends the current line (blank or not) and applies any pending
+        # alignment
+        self._newline()
+        self._line.append(marker)
+        self._column = len(marker)
+        self._newline()
+        # the printer isn't at a line break after a logo or barcode
+        self._at_linebreak = False
+
+    def set_alignment(self, alignment):
+        if alignment not in (Alignment.left, Alignment.center, Alignment.right):
+            raise KeyError('unknown alignment {}'.format(alignment))
+        self._alignment = alignment
+        if self._at_linebreak:
+            self._line_alignment = alignment
+
+    def set_emphasis(self, on_off):
+        self._at_linebreak = False
+
+    def set_double_height(self, on_off):
+        self._at_linebreak = False
+
+    def set_double_width(self, on_off):
+        self._double_width = on_off == DoubleWidth.on
+        self._at_linebreak = False
+
+    def set_underline(self, on_off):
+        self._at_linebreak = False
+
+    def set_font_size(self, width, height):
+        assert 1 <= width <= 8, "width must be between 1 and 8"
+        assert 1 <= height <= 8, "height must be between 1 and 8"
+        self._font_width = width
+        self._at_linebreak = False
+
+    def print_text(self, text):
+        for n, part in enumerate(text.split('\n')):
+            if n:
+                self._newline()
+            self._add(part)
+        self._at_linebreak = text.endswith('\n')
+
+    def print_encoded_text(self, data):
+        self.print_text(data.decode(self._codepage))
+
+    def print_logo(self, logo_num):
+        self._add_marker('[logo {}]'.format(logo_num))
+
+    def print_barcode(self, barcode_type, barcode_data, hri_posn, barcode_height):
+        self._add_marker('[barcode {}: {}]'.format(barcode_type.name, barcode_data))
+
+    def linebreak(self):
+        self._newline()
+
+    def feed_and_cut(self):
+        if self._line:
+            self._newline()
+        self._lines.append('-' * self._chars_per_line)
+        self._at_linebreak = True
+        self.flush()
+
+    def flush(self):
+        if self._lines:
+            self._output.write('\n'.join(self._lines) + '\n')
+            self._lines = []
+
+class ArchivingSerial(object):
+    """Wraps a serial port, keeping a raw copy of every byte written to it.
+
+    Use it as the output device of a printer backend. Archived bytes are
+    buffered and written to archive once buffer_size bytes have built up, or
+    when flush() is called.
+    """
+
+    def __init__(self, serial, archive, buffer_size=65536):
+        self._serial = serial
+        self._archive = archive
+        self._buffer_size = buffer_size
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, data):
+        self._serial.write(data)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self._buffer_size:
+            self._flush_archive()
+
+    def _flush_archive(self):
+        if self._buffer:
+            self._archive.write(b''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def flush(self):
+        self._flush_archive()
+        if hasattr(self._serial, 'flush'):
+            self._serial.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._serial, name)
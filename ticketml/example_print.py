@@ -6,6 +6,7 @@
 # found in the LICENSE.md file.
 
 import argparse
+import io
 import ticketml
 import serial
 import binascii
@@ -34,6 +35,9 @@ output_group = parser.add_mutually_exclusive_group(required=True)
 output_group.add_argument('--debug', action='store_true')
 output_group.add_argument('--serial', dest='serial_port', type=str, help='Serial port location')
 parser.add_argument('--baudrate', dest='baudrate', type=int, help='Serial port baudrate', default=19200)
+parser.add_argument('--cache-dir', dest='cache_dir', type=str, help='Directory to cache prepared templates in')
+parser.add_argument('--archive-text', dest='archive_text', type=str, help='File to append a plain text copy of each ticket to')
+parser.add_argument('--archive-raw', dest='archive_raw', type=str, help='File to append the raw bytes sent to the printer to')
 
 
 def main():
@@ -43,11 +47,37 @@ def main():
         output = serial.Serial(args.serial_port, args.baudrate)
     elif args.debug:
         output = MockSerial()
-    backend = BACKENDS.get(args.backend)(output)
-    
-    for filename in args.filenames:
-        with open(filename, 'r') as f:
-            ticket_xml = f.read()
-        ticket_xml = ''.join([x.lstrip() for x in ticket_xml.split('\n')])
-        ticket = ticketml.TicketML.parse(ticket_xml)
-        ticket.go({}, backend)
+    raw_archive = text_archive = text_backend = None
+    try:
+        if args.archive_raw:
+            raw_archive = open(args.archive_raw, 'ab')
+            output = ticketml.ArchivingSerial(output, raw_archive)
+        backend = BACKENDS.get(args.backend)(output)
+        if args.archive_text:
+            text_archive = io.open(args.archive_text, 'a', encoding='utf-8')
+            text_backend = ticketml.TextBackend.for_printer(text_archive, backend)
+            backend = ticketml.FanoutBackend(backend, text_backend)
+        registry = ticketml.TemplateRegistry(args.cache_dir) if args.cache_dir else None
+
+        for filename in args.filenames:
+            with open(filename, 'r') as f:
+                ticket_xml = f.read()
+            ticket_xml = ''.join([x.lstrip() for x in ticket_xml.split('\n')])
+            if registry:
+                ticket = registry.get(ticket_xml, BACKENDS.get(args.backend))
+            else:
+                ticket = ticketml.TicketML.parse(ticket_xml)
+            ticket.go({}, backend)
+    finally:
+        # keep the audit trail for everything sent, even if printing failed
+        if raw_archive:
+            try:
+                output.flush()
+            finally:
+                raw_archive.close()
+        if text_archive:
+            try:
+                if text_backend:
+                    text_backend.flush()
+            finally:
+                text_archive.close()
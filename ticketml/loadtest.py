@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 the TicketML authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE.md file.
+
+"""Load testing against simulated printers.
+
+Every virtual printer is a fake serial device with its own simulated clock.
+Bytes take as long to arrive as the configured baud rate allows, sit in a
+receive buffer of limited size, and are only consumed as fast as the print
+mechanism can feed, cut and print logos and barcodes. A write which would
+overflow the buffer waits (in simulated time) until enough has been printed.
+Tickets are rendered through the real library, so the report reflects the
+bytes it actually generates. The host's real rendering time is reported
+separately and never enters the simulated clock, so runs with the same seed
+give the same results; a fixed per-ticket render cost can be simulated
+instead.
+"""
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import argparse
+import bisect
+import io
+import random
+import time
+
+from .ticketml import CbmBackend, Ibm4610Backend, CommandTable
+from .registry import prepare
+
+class PrinterProfile(object):
+    """Timing characteristics of one printer model.
+
+    The values in PROFILES are placeholders, not measurements or data sheet
+    figures. Measure your own printers and adjust them before relying on the
+    numbers for anything.
+    """
+
+    def __init__(self, name, backend_cls, baudrate, buffer_size, line_time, cut_time, logo_time, barcode_time):
+        self.name = name
+        self.backend_cls = backend_cls
+        self.baudrate = baudrate
+        self.buffer_size = buffer_size
+        self.line_time = line_time
+        self.cut_time = cut_time
+        self.logo_time = logo_time
+        self.barcode_time = barcode_time
+
+PROFILES = {
+    'cbm': PrinterProfile(
+        'Citizen CBM-1000', CbmBackend, baudrate=19200, buffer_size=4096,
+        line_time=0.025, cut_time=0.5, logo_time=0.35, barcode_time=0.2),
+    'ibm4610': PrinterProfile(
+        'IBM 4610', Ibm4610Backend, baudrate=19200, buffer_size=4096,
+        line_time=0.02, cut_time=0.7, logo_time=0.3, barcode_time=0.15),
+}
+
+class VirtualPrinter(object):
+    """A serial device which simulates a printer's speed instead of printing.
+
+    `now` is the simulated time at which the host finishes its last write;
+    `finished_at` is when the print mechanism will have printed everything
+    sent so far.
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        self._parse_commands(CommandTable.for_backend(profile.backend_cls))
+
+        self.now = 0.0
+        self.finished_at = 0.0
+        self.busy_time = 0.0
+        self.bytes_written = 0
+        self._buffer = []
+        self._buffered = 0
+        self._font_height = 1
+
+    def _parse_commands(self, commands):
+        # every command sequence the backend can send, mapped to what it
+        # does to the print mechanism
+        actions = {}
+        for command in commands.alignment.values():
+            actions[command] = ('none', None)
+        for style in commands.styles.values():
+            for command in style.values():
+                actions[command] = ('none', None)
+        for command in commands.printing_mode or []:
+            actions[command] = ('none', None)
+        for (width, height), command in commands.font_size.items():
+            actions[command] = ('font_height', height)
+        for command in commands.barcode_header.values():
+            actions[command] = ('none', None)
+        for command in commands.barcode.values():
+            actions[command] = ('barcode', None)
+        for command in commands.logo.values():
+            actions[command] = ('logo', None)
+        # any leading line feeds are counted as lines; pending commands may
+        # be inserted after the first of them
+        cut = commands.feed_and_cut.lstrip(b'\n') or commands.feed_and_cut
+        actions[cut] = ('cut', None)
+
+        self._actions = actions
+        self._action_lengths = sorted(set(len(command) for command in actions), reverse=True)
+        self._action_starts = frozenset(command[:1] for command in actions)
+        self._barcode_length_prefix = commands.barcode_length_prefix
+        self._barcode_terminator = commands.barcode_terminator
+
+    def _match(self, data, i):
+        for length in self._action_lengths:
+            action = self._actions.get(data[i:i + length])
+            if action is not None:
+                return length, action
+        return 1, None
+
+    def _mechanism_time(self, data):
+        profile = self.profile
+        cost = 0.0
+        i = 0
+        size = len(data)
+        while i < size:
+            byte = data[i:i + 1]
+            if byte == b'\n':
+                cost += profile.line_time * self._font_height
+                i += 1
+                continue
+            if byte not in self._action_starts:
+                i += 1
+                continue
+
+            length, action = self._match(data, i)
+            i += length
+            if action is None:
+                continue
+            kind, value = action
+            if kind == 'font_height':
+                self._font_height = value
+            elif kind == 'logo':
+                cost += profile.logo_time
+            elif kind == 'cut':
+                cost += profile.cut_time
+            elif kind == 'barcode':
+                cost += profile.barcode_time
+                # skip the barcode data, which may contain anything
+                if self._barcode_length_prefix:
+                    i += 1 + bytearray(data[i:i + 1] or b'\0')[0]
+                elif self._barcode_terminator:
+                    end = data.find(self._barcode_terminator, i)
+                    i = size if end == -1 else end + len(self._barcode_terminator)
+        return cost
+
+    def _drain(self, until):
+        while self._buffer and self._buffer[0][1] <= until:
+            self._buffered -= self._buffer.pop(0)[0]
+
+    def write(self, data):
+        size = len(data)
+        self._drain(self.now)
+        while self._buffer and self._buffered + size > self.profile.buffer_size:
+            # receive buffer is full: wait for the printer to catch up
+            self.now = self._buffer[0][1]
+            self._drain(self.now)
+
+        # 8 data bits plus start and stop bits
+        self.now += size * 10 / self.profile.baudrate
+        cost = self._mechanism_time(data)
+        start = max(self.now, self.finished_at)
+        self.finished_at = start + cost
+        self.busy_time += cost
+        self.bytes_written += size
+        self._buffer.append((size, self.finished_at))
+        self._buffered += size
+
+    def flush(self):
+        self.now = max(self.now, self.finished_at)
+
+DEFAULT_TICKETS = [
+    ('''<ticket><logo num="1" /><align mode="center"><font width="2" height="2"><sensibreak>Inception: Behind the Scenes</sensibreak></font><br />Screen 1<br /><b>Row F Seat 12</b><br />Adult &#163;5.00<br /></align><barcode type="CODE39">T0001234</barcode></ticket>''', 6),
+    ('''<ticket><logo num="1" /><align mode="center"><font width="2" height="2"><sensibreak>The Winter All-Nighter</sensibreak></font><br />Screen 2<br /><b>Row C Seat 4</b><br />Student &#163;4.00<br />Includes entry to all five films<br />Doors open 23:30<br /></align><barcode type="CODE39">T0005678</barcode></ticket>''', 3),
+    ('''<ticket><align mode="center"><logo num="2" /></align>Popcorn (large)      &#163;3.50<br />Cola                 &#163;2.00<br /><b>Total                &#163;5.50</b><br /><align mode="center">Thank you!</align><br /></ticket>''', 1),
+]
+
+class LoadTestResult(object):
+    def __init__(self, profile, printers, latencies, duration, render_time):
+        self.profile = profile
+        self.printers = printers
+        self.latencies = sorted(latencies)
+        self.duration = duration
+        self.render_time = render_time
+
+    @property
+    def tickets(self):
+        return len(self.latencies)
+
+    @property
+    def tickets_per_minute(self):
+        if not self.duration:
+            return 0.0
+        return self.tickets * 60 / self.duration
+
+    def latency_percentile(self, percentile):
+        if not self.latencies:
+            return 0.0
+        index = int(round(percentile / 100 * (len(self.latencies) - 1)))
+        return self.latencies[index]
+
+    def idle_times(self):
+        return [self.duration - printer.busy_time for printer in self.printers]
+
+    def report(self):
+        lines = [
+            '{} x {}, {} tickets in {:.1f}s (simulated)'.format(
+                len(self.printers), self.profile.name, self.tickets, self.duration),
+            'throughput: {:.1f} tickets/minute'.format(self.tickets_per_minute),
+            'latency: p50 {:.2f}s  p90 {:.2f}s  p99 {:.2f}s  max {:.2f}s'.format(
+                self.latency_percentile(50), self.latency_percentile(90),
+                self.latency_percentile(99), self.latency_percentile(100)),
+        ]
+        for n, (printer, idle) in enumerate(zip(self.printers, self.idle_times())):
+            lines.append('printer {}: {} bytes, idle {:.1f}s ({:.0%})'.format(
+                n, printer.bytes_written, idle, idle / self.duration if self.duration else 0))
+        lines.append('host rendering: {:.1f}ms per ticket (wall clock, not simulated)'.format(
+            self.render_time * 1000 / self.tickets if self.tickets else 0))
+        return '\n'.join(lines)
+
+class LoadTest(object):
+    """Drives a weighted mix of tickets through N virtual printers.
+
+    tickets is a list of (xml, weight) pairs. With arrival_rate (tickets per
+    minute) set, tickets arrive evenly spaced; otherwise they are all queued
+    at once, which measures the maximum throughput. Each ticket goes to the
+    printer which will finish its current work first. Templates are prepared
+    once up front, as they would be with a TemplateRegistry.
+
+    render_cost is the simulated host time, in seconds, to render each
+    ticket. The real rendering time is measured and reported, but not added
+    to the simulated clock, so results only depend on the seed.
+    """
+
+    def __init__(self, profile, printers=1, tickets=None, arrival_rate=None, seed=0, render_cost=0.0):
+        self.profile = profile
+        self.render_cost = render_cost
+        self.printer_count = printers
+        self.tickets = tickets or DEFAULT_TICKETS
+        self.arrival_rate = arrival_rate
+        self.seed = seed
+
+    def run(self, count):
+        rng = random.Random(self.seed)
+        templates = [prepare(xml, self.profile.backend_cls) for xml, weight in self.tickets]
+        cumulative_weights = []
+        total = 0
+        for xml, weight in self.tickets:
+            total += weight
+            cumulative_weights.append(total)
+
+        printers = [VirtualPrinter(self.profile) for n in range(self.printer_count)]
+        backends = [self.profile.backend_cls(printer) for printer in printers]
+
+        latencies = []
+        render_time = 0.0
+        for n in range(count):
+            arrival = n * 60 / self.arrival_rate if self.arrival_rate else 0.0
+            template = templates[bisect.bisect_right(cumulative_weights, rng.random() * total)]
+            index = min(range(len(printers)), key=lambda i: printers[i].finished_at)
+            printer = printers[index]
+
+            # the host renders the ticket before any of it is sent
+            printer.now = max(printer.now, arrival) + self.render_cost
+            started = time.time()
+            template.go({}, backends[index])
+            render_time += time.time() - started
+
+            latencies.append(printer.finished_at - arrival)
+
+        duration = max(printer.finished_at for printer in printers)
+        return LoadTestResult(self.profile, printers, latencies, duration, render_time)
+
+parser = argparse.ArgumentParser(description='Load test printing against simulated printers.')
+
+parser.add_argument('filenames', metavar='F', type=str, help='templates to print, optionally weighted as FILE:WEIGHT', nargs='*')
+parser.add_argument('--printer', dest='printer', type=str, help='Printer model to simulate', default='cbm', choices=PROFILES.keys())
+parser.add_argument('--printers', dest='printers', type=int, help='Number of printers', default=1)
+parser.add_argument('--tickets', dest='tickets', type=int, help='Number of tickets to print', default=500)
+parser.add_argument('--rate', dest='rate', type=float, help='Ticket arrival rate per minute (default: all at once)')
+parser.add_argument('--baudrate', dest='baudrate', type=int, help='Override the serial port baudrate')
+parser.add_argument('--buffer-size', dest='buffer_size', type=int, help='Override the printer receive buffer size')
+parser.add_argument('--seed', dest='seed', type=int, help='Random seed for the ticket mix', default=0)
+parser.add_argument('--render-cost', dest='render_cost', type=float, help='Simulated host time to render each ticket, in seconds', default=0.0)
+
+
+def main():
+    args = parser.parse_args()
+
+    base = PROFILES[args.printer]
+    profile = PrinterProfile(
+        base.name, base.backend_cls,
+        baudrate=args.baudrate or base.baudrate,
+        buffer_size=args.buffer_size or base.buffer_size,
+        line_time=base.line_time, cut_time=base.cut_time,
+        logo_time=base.logo_time, barcode_time=base.barcode_time)
+
+    tickets = []
+    for filename in args.filenames:
+        weight = 1
+        name, sep, suffix = filename.rpartition(':')
+        if sep and suffix.isdigit():
+            filename, weight = name, int(suffix)
+        with io.open(filename, 'r', encoding='utf-8') as f:
+            ticket_xml = f.read()
+        ticket_xml = ''.join([x.lstrip() for x in ticket_xml.split('\n')])
+        tickets.append((ticket_xml.encode('utf-8'), weight))
+
+    result = LoadTest(profile, args.printers, tickets, args.rate, args.seed, args.render_cost).run(args.tickets)
+    print(result.report())
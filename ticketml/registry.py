@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 the TicketML authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE.md file.
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import binascii
+import collections
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from enum import Enum
+
+from . import __version__
+from .ticketml import (CommandTable, TicketML, Emphasis, DoubleHeight, DoubleWidth,
+                       Underline, Alignment, BarcodeType, BarcodeHriPosition)
+
+# bump this whenever the cached PreparedTemplate layout changes
+CACHE_FORMAT = 2
+
+# the only backend calls a cached template may replay, with the type of
+# each argument: an enum, bytes, text or an inclusive (min, max) int range
+OPERATIONS = {
+    'set_alignment': (Alignment,),
+    'set_emphasis': (Emphasis,),
+    'set_double_height': (DoubleHeight,),
+    'set_double_width': (DoubleWidth,),
+    'set_underline': (Underline,),
+    'set_font_size': ((1, 8), (1, 8)),
+    'print_encoded_text': (bytes,),
+    'print_logo': ((0, 255),),
+    'print_barcode': (BarcodeType, type(''), BarcodeHriPosition, (1, 255)),
+    'linebreak': (),
+    'feed_and_cut': (),
+}
+
+_replace = getattr(os, 'replace', os.rename)
+
+# cache entries are shared between workers, which may run as different
+# users, so give them the usual permissions for new files rather than
+# mkstemp's 0600
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+class PreparedTemplate(object):
+    """A template reduced to the flat list of backend calls it makes.
+
+    Text is stored already encoded in the target backend's codepage, so
+    rendering is a straight replay with no XML parsing or interpretation.
+    """
+
+    def __init__(self, operations):
+        self.operations = operations
+
+    def go(self, context, backend):
+        for name, args in self.operations:
+            getattr(backend, name)(*args)
+
+    def to_json(self):
+        return json.dumps([[name, [_dump_arg(arg) for arg in args]] for name, args in self.operations])
+
+    @classmethod
+    def from_json(cls, data, backend_cls=None):
+        """Load a template saved by to_json, checking every operation.
+
+        Raises ValueError if any operation or argument is not one the
+        backend could have been sent, so a bad entry is rejected as a whole
+        rather than failing part way through a ticket. Given backend_cls,
+        barcodes are also checked against what that backend supports.
+        """
+        commands = CommandTable.for_backend(backend_cls) if backend_cls else None
+        operations = []
+        for name, args in json.loads(data):
+            signature = OPERATIONS.get(name)
+            if signature is None:
+                raise ValueError('unexpected operation {}'.format(name))
+            if len(args) != len(signature):
+                raise ValueError('{} takes {} arguments'.format(name, len(signature)))
+            args = tuple(_load_arg(arg, expected) for arg, expected in zip(args, signature))
+            if name == 'print_barcode' and commands is not None:
+                if args[0] not in commands.barcode:
+                    raise ValueError('unsupported barcode type {}'.format(args[0]))
+                args[1].encode(commands.codepage)
+            operations.append((str(name), args))
+        return cls(operations)
+
+def _dump_arg(arg):
+    if isinstance(arg, bytes):
+        return {'bytes': binascii.hexlify(arg).decode('ascii')}
+    if isinstance(arg, Enum):
+        return {'enum': type(arg).__name__, 'name': arg.name}
+    return arg
+
+def _load_arg(arg, expected):
+    if isinstance(expected, tuple):
+        low, high = expected
+        if isinstance(arg, bool) or not isinstance(arg, int) or not low <= arg <= high:
+            raise ValueError('expected an integer from {} to {}, not {!r}'.format(low, high, arg))
+        return arg
+    if expected is bytes:
+        if not isinstance(arg, dict) or set(arg) != set(['bytes']):
+            raise ValueError('expected bytes, not {!r}'.format(arg))
+        return binascii.unhexlify(arg['bytes'])
+    if expected is type(''):
+        if not isinstance(arg, type('')):
+            raise ValueError('expected text, not {!r}'.format(arg))
+        return arg
+    if not isinstance(arg, dict) or arg.get('enum') != expected.__name__:
+        raise ValueError('expected {}, not {!r}'.format(expected.__name__, arg))
+    try:
+        return expected[arg['name']]
+    except (KeyError, TypeError):
+        raise ValueError('unknown {} {!r}'.format(expected.__name__, arg.get('name')))
+
+class _RecordingBackend(object):
+    def __init__(self, backend_cls):
+        self._commands = CommandTable.for_backend(backend_cls)
+        self.operations = []
+
+    def get_characters_per_line(self, font_width):
+        return self._commands.chars_per_line // font_width
+
+    def print_text(self, text):
+        data = text.encode(self._commands.codepage)
+        if self.operations and self.operations[-1][0] == 'print_encoded_text':
+            data = self.operations.pop()[1][0] + data
+        self.operations.append(('print_encoded_text', (data,)))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        def record(*args):
+            self.operations.append((name, args))
+        return record
+
+def prepare(xml, backend_cls):
+    """Interpret a template once against backend_cls, without printing it."""
+    recorder = _RecordingBackend(backend_cls)
+    TicketML.parse(xml).go({}, recorder)
+    return PreparedTemplate(recorder.operations)
+
+class TemplateRegistry(object):
+    """Caches prepared templates in memory and in an on-disk directory.
+
+    Entries are keyed by a hash of the template source, the library version
+    and the backend parameters a prepared template depends on, so editing a
+    template (or upgrading ticketml) simply produces a new entry. Files are
+    written to a temporary name and atomically renamed into place, which
+    makes it safe for several processes to share one cache directory.
+
+    Entries are stored as JSON and may only replay the backend calls listed
+    in OPERATIONS, so a tampered cache file can at worst print the wrong
+    ticket. The most recently used memory_size templates are also kept in
+    memory.
+    """
+
+    def __init__(self, cache_dir, memory_size=64):
+        self.cache_dir = cache_dir
+        self.memory_size = memory_size
+        self._memory = collections.OrderedDict()
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                if not os.path.isdir(cache_dir):
+                    raise
+
+    def cache_key(self, xml, backend_cls):
+        commands = CommandTable.for_backend(backend_cls)
+        if not isinstance(xml, bytes):
+            xml = xml.encode('utf-8')
+        digest = hashlib.sha256()
+        digest.update(xml)
+        digest.update('\0{}\0{}\0{}\0{}\0{}.{}'.format(
+            __version__, CACHE_FORMAT, commands.codepage, commands.chars_per_line,
+            sys.version_info[0], sys.version_info[1]).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, '{}.json'.format(key))
+
+    def get(self, xml, backend_cls):
+        key = self.cache_key(xml, backend_cls)
+        template = self._memory.pop(key, None)
+        if template is None:
+            template = self._load(key, backend_cls)
+            if template is None:
+                template = prepare(xml, backend_cls)
+                self._store(key, template)
+        self._memory[key] = template
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+        return template
+
+    def get_file(self, filename, backend_cls):
+        with open(filename, 'rb') as f:
+            return self.get(f.read(), backend_cls)
+
+    def _load(self, key, backend_cls):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return PreparedTemplate.from_json(f.read().decode('utf-8'), backend_cls)
+        except Exception:
+            # missing, truncated or otherwise unreadable - prepare it again
+            return None
+
+    def _store(self, key, template):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.{}.'.format(key), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(template.to_json().encode('utf-8'))
+            os.chmod(tmp_path, FILE_MODE)
+            _replace(tmp_path, self._path(key))
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def clear(self):
+        self._memory.clear()
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith('.json'):
+                try:
+                    os.unlink(os.path.join(self.cache_dir, filename))
+                except OSError:
+                    pass
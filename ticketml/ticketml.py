@@ -72,62 +72,182 @@ else:
     def bchr(bdata):
         return bytes([bdata])
 
+STYLE_ENUMS = {
+    'emphasis': Emphasis,
+    'double_height': DoubleHeight,
+    'double_width': DoubleWidth,
+    'underline': Underline,
+}
+
+class CommandTable(object):
+    """Fully precomputed escape sequences for one printer model.
+
+    A table is compiled once per backend class from its COMMAND_SPEC; every
+    enumerable command (alignments, style toggles, printing mode bytes, font
+    sizes, barcode headers and logos) is encoded up front, so emitting one is
+    just a lookup.
+    """
+
+    def __init__(self, spec):
+        self.codepage = spec.get('codepage', 'cp437')
+        self.chars_per_line = spec.get('chars_per_line', 48)
+
+        alignment = h2b(spec['alignment'])
+        self.alignment = dict(
+            (align, alignment + bchr(value))
+            for align, value in spec['alignment_values'].items())
+
+        self.styles = {}
+        for style, command in spec.get('styles', {}).items():
+            enum = STYLE_ENUMS[style]
+            self.styles[style] = dict(
+                (on_off, h2b(command) + bchr(int(on_off.value)))
+                for on_off in enum)
+
+        self.printing_mode = None
+        self.printing_mode_bits = {}
+        if 'printing_mode' in spec:
+            printing_mode = h2b(spec['printing_mode'])
+            self.printing_mode = [printing_mode + bchr(mode) for mode in range(256)]
+            self.printing_mode_bits = dict(spec['printing_mode_bits'])
+
+        font_size = h2b(spec['font_size'])
+        self.font_size = dict(
+            ((width, height), font_size + bchr(((width - 1) << 4) | (height - 1)))
+            for width in range(1, 9)
+            for height in range(1, 9))
+
+        hri_position = h2b(spec['barcode_hri_position'])
+        barcode_height = h2b(spec['barcode_height'])
+        self.barcode_header = dict(
+            ((hri_posn, height), hri_position + bchr(value) + barcode_height + bchr(height))
+            for hri_posn, value in spec['barcode_hri_positions'].items()
+            for height in range(1, 256))
+
+        barcode = h2b(spec['barcode'])
+        self.barcode = dict(
+            (barcode_type, barcode + bchr(value))
+            for barcode_type, value in spec['barcode_types'].items())
+        self.barcode_length_prefix = spec.get('barcode_length_prefix', False)
+        self.barcode_terminator = h2b(spec.get('barcode_terminator', b''))
+
+        logo_prefix = h2b(spec['logo'])
+        logo_suffix = h2b(spec.get('logo_suffix', b''))
+        self.logo = dict(
+            (num, logo_prefix + bchr(num) + logo_suffix)
+            for num in range(256))
+
+        self.feed_and_cut = h2b(spec['feed_and_cut'])
+
+    @classmethod
+    def for_backend(cls, backend_cls):
+        # cached on the class itself so subclasses with their own
+        # COMMAND_SPEC don't pick up their parent's table
+        table = backend_cls.__dict__.get('_command_table')
+        if table is None:
+            table = cls(backend_cls.COMMAND_SPEC)
+            backend_cls._command_table = table
+        return table
+
 class BaseBackend(object):
-    ALIGNMENT_LEFT = 0
-    ALIGNMENT_CENTER = 1
-    ALIGNMENT_RIGHT = 2
-    ALIGNMENT_LOOKUP = {
-        Alignment.left: ALIGNMENT_LEFT,
-        Alignment.center: ALIGNMENT_CENTER,
-        Alignment.right: ALIGNMENT_RIGHT,
-    }
+    """Drives a receipt printer described by a declarative COMMAND_SPEC.
 
-    CODEPAGE = 'cp437'
+    Subclasses only need to provide COMMAND_SPEC: a dict of hex-encoded
+    command prefixes and value maps. Printers which toggle styles with
+    individual commands list them under 'styles'; printers which pack them
+    into a single mode byte give 'printing_mode' and 'printing_mode_bits'.
+    """
 
-    BarcodeHriPosition_MAP = {
-        BarcodeHriPosition.none: 0,
-        BarcodeHriPosition.above: 1,
-        BarcodeHriPosition.below: 2,
-        BarcodeHriPosition.both: 3,
-    }
+    COMMAND_SPEC = None
 
-    BASE_CHARS_PER_LINE = 48
+    def __init__(self, serial):
+        self._serial = serial
+        self._on_next_linebreak = b''
+        self._at_linebreak = True
+        self._commands = CommandTable.for_backend(type(self))
+
+        self._write_at_linebreak(self._commands.alignment[Alignment.left])
+        if self._commands.printing_mode is not None:
+            self._set_printing_mode(0)
 
     def _start_print_barcode(self, barcode_type, hri_posn, barcode_height):
-        if barcode_type not in self.BARCODE_MAP:
+        if barcode_type not in self._commands.barcode:
             raise Exception('unacceptable barcode type: {}'.format(barcode_type))
-        barcode_type_byte = self.BARCODE_MAP[barcode_type]
-
-        if hri_posn not in self.BarcodeHriPosition_MAP:
-            raise Exception('unacceptable barcode HRI position: {}'.format(barcode_type))
-        hri_posn_byte = self.BarcodeHriPosition_MAP[hri_posn]
+        barcode_start = self._commands.barcode[barcode_type]
 
         assert 1 <= barcode_height <= 255, "barcode height must be between 1 and 255"
 
-        self._write_immediately(h2b(b'1d48') + bchr(hri_posn_byte))
-        self._write_immediately(h2b(b'1d68') + bchr(barcode_height))
+        header = self._commands.barcode_header.get((hri_posn, barcode_height))
+        if header is None:
+            raise Exception('unacceptable barcode HRI position: {}'.format(hri_posn))
+        self._write_immediately(header)
 
-        return barcode_type_byte
+        return barcode_start
 
-    def _set_alignment(self, new_mode):
-        self._write_at_linebreak(h2b(b'1b61') + bchr(new_mode))
+    def _set_printing_mode(self, new_mode):
+        self._printing_mode = new_mode
+        self._write_immediately(self._commands.printing_mode[new_mode])
+
+    def _set_style(self, style, on_off):
+        styles = self._commands.styles.get(style)
+        if styles is not None:
+            self._write_immediately(styles[on_off])
+        else:
+            bit = self._commands.printing_mode_bits[style]
+            self._set_printing_mode(set_or_clear_bit(self._printing_mode, bit, on_off.value))
 
     def set_alignment(self, alignment):
-        if alignment not in self.ALIGNMENT_LOOKUP:
+        if alignment not in self._commands.alignment:
             raise KeyError('unknown alignment {}'.format(alignment))
-        self._set_alignment(self.ALIGNMENT_LOOKUP[alignment])
+        self._write_at_linebreak(self._commands.alignment[alignment])
+
+    def set_emphasis(self, on_off):
+        self._set_style('emphasis', on_off)
+
+    def set_double_height(self, on_off):
+        self._set_style('double_height', on_off)
 
+    def set_double_width(self, on_off):
+        self._set_style('double_width', on_off)
+
+    def set_underline(self, on_off):
+        self._set_style('underline', on_off)
 
     def set_font_size(self, width, height):
         assert 1 <= width <= 8, "width must be between 1 and 8"
         assert 1 <= height <= 8, "height must be between 1 and 8"
 
-        hex = '{}{}'.format(width-1, height-1)
-
-        self._write_immediately(h2b(b'1d21' + hex))
+        self._write_immediately(self._commands.font_size[(width, height)])
 
     def get_characters_per_line(self, font_width):
-        return self.BASE_CHARS_PER_LINE // font_width
+        return self._commands.chars_per_line // font_width
+
+    def print_text(self, text):
+        self._write_immediately(text.encode(self._commands.codepage))
+
+    def print_encoded_text(self, data):
+        # text already encoded in this backend's codepage, e.g. by a
+        # PreparedTemplate
+        self._write_immediately(data)
+
+    def print_logo(self, logo_num):
+        assert 0 <= logo_num <= 255, "logo number must be between 0 and 255"
+        logo = self._commands.logo[logo_num]
+
+        self._write_immediately(b'\n')
+        self._write_immediately(logo)
+
+    def print_barcode(self, barcode_type, barcode_data, hri_posn, barcode_height):
+        barcode_start = self._start_print_barcode(barcode_type, hri_posn, barcode_height)
+        barcode_data = barcode_data.encode(self._commands.codepage)
+        if self._commands.barcode_length_prefix:
+            barcode_data = bchr(len(barcode_data)) + barcode_data
+        self._write_immediately(b'\n')
+        self._write_immediately(barcode_start + barcode_data + self._commands.barcode_terminator)
+
+    def feed_and_cut(self):
+        self._write_immediately(self._commands.feed_and_cut)
+        self._at_linebreak = True
 
     def linebreak(self):
         self._write_immediately(b'\n')
@@ -148,136 +268,99 @@ class BaseBackend(object):
             self._on_next_linebreak += data
 
 
-class Ibm4610Backend(BaseBackend):
-    BARCODE_MAP = {
-        BarcodeType.upc_a: 0,
-        BarcodeType.upc_e: 1,
-        BarcodeType.jan_13: 2,
-        BarcodeType.jan_8: 3,
-        BarcodeType.code_39: 4,
-        BarcodeType.itf: 5,
-        BarcodeType.codabar: 6,
-        BarcodeType.code_93: 8,
-        BarcodeType.code_128: 7,
-    }
+ALIGNMENT_VALUES = {
+    Alignment.left: 0,
+    Alignment.center: 1,
+    Alignment.right: 2,
+}
 
-    BASE_CHARS_PER_LINE = 44
-
-    def __init__(self, serial):
-        self._serial = serial
-        self._on_next_linebreak = b''
-        self._at_linebreak = True
-
-        self._set_alignment(self.ALIGNMENT_LEFT)
-
-    def set_emphasis(self, on_off):
-        self._write_immediately(h2b(b'1b47') + bchr(int(bool(on_off == Emphasis.on))))
-
-    def set_double_height(self, on_off):
-        self._write_immediately(h2b(b'1b68') + bchr(int(bool(on_off == DoubleHeight.on))))
-
-    def set_double_width(self, on_off):
-        self._write_immediately(h2b(b'1b57') + bchr(int(bool(on_off == DoubleWidth.on))))
+BARCODE_HRI_POSITIONS = {
+    BarcodeHriPosition.none: 0,
+    BarcodeHriPosition.above: 1,
+    BarcodeHriPosition.below: 2,
+    BarcodeHriPosition.both: 3,
+}
 
-    def set_underline(self, on_off):
-        self._write_immediately(h2b(b'1b2d') + bchr(int(bool(on_off == Underline.on))))
-
-
-    def print_text(self, text):
-        self._write_immediately(text.encode(self.CODEPAGE))
-
-    def print_logo(self, logo_num):
-        self._write_immediately(b'\n')
-        self._write_immediately(h2b(b'1d2f00') + bchr(logo_num))
-
-    def print_barcode(self, barcode_type, barcode_data, hri_posn, barcode_height):
-        barcode_type_byte = self._start_print_barcode(barcode_type, hri_posn, barcode_height)
-        self._write_immediately(b'\n')
-        self._write_immediately(h2b(b'1d6b') + bchr(barcode_type_byte) + barcode_data.encode(self.CODEPAGE) + bchr(0))
-
-    def feed_and_cut(self):
-        self._write_immediately(h2b(b'0c'))
-        self._at_linebreak = True
-
-class CbmBackend(BaseBackend):
-    EMPHASIS_BIT = 3
-    DOUBLEHEIGHT_BIT = 4
-    DOUBLEWIDTH_BIT = 5
-    UNDERLINE_BIT = 7
-
-    ALIGNMENT_LEFT = 0
-    ALIGNMENT_CENTER = 1
-    ALIGNMENT_RIGHT = 2
-    ALIGNMENT_LOOKUP = {
-        Alignment.left: ALIGNMENT_LEFT,
-        Alignment.center: ALIGNMENT_CENTER,
-        Alignment.right: ALIGNMENT_RIGHT,
+class Ibm4610Backend(BaseBackend):
+    COMMAND_SPEC = {
+        'codepage': 'cp437',
+        'chars_per_line': 44,
+
+        'alignment': b'1b61',
+        'alignment_values': ALIGNMENT_VALUES,
+
+        'styles': {
+            'emphasis': b'1b47',
+            'double_height': b'1b68',
+            'double_width': b'1b57',
+            'underline': b'1b2d',
+        },
+
+        'font_size': b'1d21',
+
+        'barcode_hri_position': b'1d48',
+        'barcode_hri_positions': BARCODE_HRI_POSITIONS,
+        'barcode_height': b'1d68',
+        'barcode': b'1d6b',
+        'barcode_types': {
+            BarcodeType.upc_a: 0,
+            BarcodeType.upc_e: 1,
+            BarcodeType.jan_13: 2,
+            BarcodeType.jan_8: 3,
+            BarcodeType.code_39: 4,
+            BarcodeType.itf: 5,
+            BarcodeType.codabar: 6,
+            BarcodeType.code_93: 8,
+            BarcodeType.code_128: 7,
+        },
+        'barcode_terminator': b'00',
+
+        'logo': b'1d2f00',
+
+        'feed_and_cut': b'0c',
     }
 
-    BARCODE_MAP = {
-        BarcodeType.upc_a: 65,
-        BarcodeType.upc_e: 66,
-        BarcodeType.jan_13: 67,
-        BarcodeType.jan_8: 68,
-        BarcodeType.code_39: 69,
-        BarcodeType.itf: 70,
-        BarcodeType.codabar: 71,
-        BarcodeType.code_93: 72,
-        BarcodeType.code_128: 73,
-    }
-    BarcodeHriPosition_MAP = {
-        BarcodeHriPosition.none: 0,
-        BarcodeHriPosition.above: 1,
-        BarcodeHriPosition.below: 2,
-        BarcodeHriPosition.both: 3,
+class CbmBackend(BaseBackend):
+    COMMAND_SPEC = {
+        'codepage': 'cp437',
+        'chars_per_line': 48,
+
+        'alignment': b'1b61',
+        'alignment_values': ALIGNMENT_VALUES,
+
+        'printing_mode': b'1b21',
+        'printing_mode_bits': {
+            'emphasis': 3,
+            'double_height': 4,
+            'double_width': 5,
+            'underline': 7,
+        },
+
+        'font_size': b'1d21',
+
+        'barcode_hri_position': b'1d48',
+        'barcode_hri_positions': BARCODE_HRI_POSITIONS,
+        'barcode_height': b'1d68',
+        'barcode': b'1d6b',
+        'barcode_types': {
+            BarcodeType.upc_a: 65,
+            BarcodeType.upc_e: 66,
+            BarcodeType.jan_13: 67,
+            BarcodeType.jan_8: 68,
+            BarcodeType.code_39: 69,
+            BarcodeType.itf: 70,
+            BarcodeType.codabar: 71,
+            BarcodeType.code_93: 72,
+            BarcodeType.code_128: 73,
+        },
+        'barcode_length_prefix': True,
+
+        'logo': b'1c70',
+        'logo_suffix': b'00',
+
+        'feed_and_cut': b'0a0a0a0a1d5601',
     }
 
-    CODEPAGE = 'cp437'
-
-    def __init__(self, serial):
-        self._serial = serial
-        self._on_next_linebreak = b''
-        self._at_linebreak = True
-
-        self._set_alignment(self.ALIGNMENT_LEFT)
-        self._set_printing_mode(0)
-
-    def _set_printing_mode(self, new_mode):
-        self._printing_mode = new_mode
-        self._write_immediately(h2b(b'1b21') + bchr(new_mode))
-
-    def _set_printing_mode_bit(self, bit, new_state):
-        self._set_printing_mode(set_or_clear_bit(self._printing_mode, bit, new_state))
-
-    def set_emphasis(self, on_off):
-        self._set_printing_mode_bit(self.EMPHASIS_BIT, on_off == Emphasis.on)
-
-    def set_double_height(self, on_off):
-        self._set_printing_mode_bit(self.DOUBLEHEIGHT_BIT, on_off == DoubleHeight.on)
-
-    def set_double_width(self, on_off):
-        self._set_printing_mode_bit(self.DOUBLEWIDTH_BIT, on_off == DoubleWidth.on)
-
-    def set_underline(self, on_off):
-        self._set_printing_mode_bit(self.UNDERLINE_BIT, on_off == Underline.on)
-
-
-    def print_text(self, text):
-        self._write_immediately(text.encode(self.CODEPAGE))
-
-    def print_logo(self, logo_num):
-        self._write_immediately(b'\n')
-        self._write_immediately(h2b(b'1c70') + bchr(logo_num) + h2b(b'00'))
-
-    def print_barcode(self, barcode_type, barcode_data, hri_posn, barcode_height):
-        barcode_type_byte = self._start_print_barcode(barcode_type, hri_posn, barcode_height)
-        self._write_immediately(b'\n')
-        self._write_immediately(h2b(b'1d6b') + bchr(barcode_type_byte) + bchr(len(barcode_data)) + barcode_data.encode(self.CODEPAGE))
-
-    def feed_and_cut(self):
-        self._write_immediately(b'\n\n\n\n' + h2b(b'1d5601'))
-        self._at_linebreak = True
-
 class TicketML(object):
     NO_PRINT_CONTENT = {
         'barcode': True,